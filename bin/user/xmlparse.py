@@ -176,34 +176,68 @@ Known issues/limitations:
     -   'hPa'
 """
 
+from __future__ import print_function
 from __future__ import with_statement
 import calendar
+import collections
 import datetime
+import hashlib
+import os
+import re
+import sys
 import syslog
 import time
-import xml.etree.ElementTree as ET
 
-import weecfg
-import weeutil
+try:
+    # use xxhash if available, it is much faster than the hashlib algorithms
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    # use lxml if available, its libxml2 based parser is much faster than the
+    # python ElementTree parser
+    from lxml import etree as ET
+    HAS_LXML = True
+except ImportError:
+    try:
+        # python 2 has a separate C implementation of ElementTree, python 3
+        # uses its C implementation automatically
+        import xml.etree.cElementTree as ET
+    except ImportError:
+        import xml.etree.ElementTree as ET
+    from xml.parsers import expat
+    HAS_LXML = False
+
+import weeutil.weeutil
 import weewx
 import weewx.drivers
 import weewx.units
 import weewx.wxformulas
-from weeutil.weeutil import ListOfDicts
 
 DRIVER_NAME = 'XmlParse'
 DRIVER_VERSION = '0.1.0'
 SUPPORTED_TIMEZONES = ('GMT', 'UTC')
-CONV_FUNCS = ListOfDicts({'Degrees F': weewx.units.FtoC,
-                          'km/h': weewx.units.conversionDict['km_per_hour']['meter_per_second'],
-                          'hPa': weewx.units.conversionDict['hPa']['mbar']})
+# an XPath spec consisting only of '/' separated element names
+SIMPLE_XPATH_RE = re.compile(r'^(\./)?[A-Za-z_][\w.-]*(/[A-Za-z_][\w.-]*)*$')
+CONV_FUNCS = {'Degrees F': weewx.units.FtoC,
+              'km/h': weewx.units.conversionDict['km_per_hour']['meter_per_second'],
+              'hPa': weewx.units.conversionDict['hPa']['mbar']}
+# compiled XPath specs keyed by XPath spec
+XPATH_CACHE = dict()
+
+# use a monotonic clock for scheduling polls if available (python 3.3+)
+try:
+    monotonic = time.monotonic
+except AttributeError:
+    monotonic = time.time
 
 if weewx.__version__ < "3":
     raise weewx.UnsupportedFeature("WeeWX 3.x or greater is required, found %s" %
                                    weewx.__version__)
 
 
-class MissingOption(StandardError):
+class MissingOption(Exception):
     """Exception thrown when a mandatory option is invalid or otherwise has not
     been included in a config stanza."""
 
@@ -234,6 +268,256 @@ def logerr(msg):
     logmsg(syslog.LOG_ERR, msg)
 
 
+def content_hash(data):
+    """Return a hash of some bytes suitable for detecting changes."""
+
+    if xxhash is not None:
+        return xxhash.xxh64(data).intdigest()
+    return hashlib.sha1(data).digest()
+
+
+def stat_signature(stat):
+    """Return a tuple identifying the state of a file from its status."""
+
+    return (getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size,
+            stat.st_ino)
+
+
+def fixed_format_parser(date_sep, time_sep):
+    """Return a parser for a fixed width numeric date-time format.
+
+    Returns a function that parses a date-time string in the format
+    '%Y<date_sep>%m<date_sep>%d<time_sep>%H:%M:%S' by slicing the string
+    rather than using strptime(). The function raises a ValueError if the
+    date-time string is not in the expected format.
+    """
+
+    def _parse(value):
+        if (len(value) != 19 or value[4] != date_sep or value[7] != date_sep or
+                value[10] != time_sep or value[13] != ':' or value[16] != ':'):
+            raise ValueError("date-time '%s' is not in the expected format" % value)
+        _digits = ''.join((value[0:4], value[5:7], value[8:10],
+                           value[11:13], value[14:16], value[17:19]))
+        if not _digits.isdigit():
+            raise ValueError("date-time '%s' is not in the expected format" % value)
+        return datetime.datetime(int(value[0:4]), int(value[5:7]),
+                                 int(value[8:10]), int(value[11:13]),
+                                 int(value[14:16]), int(value[17:19]))
+    return _parse
+
+
+# date-time formats that can be parsed without the use of strptime()
+FAST_TIME_PARSERS = {'%Y-%m-%d %H:%M:%S': fixed_format_parser('-', ' '),
+                     '%Y-%m-%dT%H:%M:%S': fixed_format_parser('-', 'T'),
+                     '%Y/%m/%d %H:%M:%S': fixed_format_parser('/', ' ')}
+
+
+def simple_path(xpath):
+    """Return the element path of a simple XPath spec.
+
+    A simple XPath spec is one that consists only of '/' separated element
+    names, eg 'devices/device/records/record/time'. Such a spec can be
+    matched against the XML data in a single pass of the XML file without the
+    need to build and search the XML tree.
+
+    Returns a tuple of element names if xpath is a simple XPath spec otherwise
+    returns None.
+    """
+
+    if SIMPLE_XPATH_RE.match(xpath) is None:
+        return None
+    if xpath.startswith('./'):
+        xpath = xpath[2:]
+    return tuple(xpath.split('/'))
+
+
+def split_xpath(xpath):
+    """Split an XPath spec into its location steps.
+
+    The XPath spec is split on '/' characters that are not within a
+    predicate or an ElementTree '{uri}' namespace qualifier.
+
+    Returns a list of location steps.
+    """
+
+    _steps = []
+    _depth = 0
+    _start = 0
+    for _i, _c in enumerate(xpath):
+        if _c in '[({':
+            _depth += 1
+        elif _c in '])}':
+            _depth -= 1
+        elif _c == '/' and _depth == 0:
+            _steps.append(xpath[_start:_i])
+            _start = _i + 1
+    _steps.append(xpath[_start:])
+    return _steps
+
+
+def common_xpath_prefix(xpaths):
+    """Find the longest common prefix of a number of XPath specs.
+
+    The prefix consists of whole location steps and leaves at least one
+    location step in each XPath spec. XPath specs that are absolute or use
+    the '//' abbreviation are not considered. There is no prefix if any
+    XPath spec relative to the prefix uses the '..' abbreviation or an
+    explicit axis (eg 'parent::'), as these may select elements outside the
+    prefix element and ElementTree elements cannot step up to their parent.
+
+    Returns None if there is no common prefix otherwise returns a tuple
+    consisting of the prefix and a list of the XPath specs relative to the
+    prefix.
+    """
+
+    if len(xpaths) < 2:
+        return None
+    _split = []
+    for _xpath in xpaths:
+        if _xpath.startswith('./'):
+            _xpath = _xpath[2:]
+        _steps = split_xpath(_xpath)
+        if '' in _steps:
+            return None
+        _split.append(_steps)
+    _length = 0
+    _max = min(len(_steps) for _steps in _split) - 1
+    while (_length < _max and
+           all(_steps[_length] == _split[0][_length] for _steps in _split)):
+        _length += 1
+    if _length == 0:
+        return None
+    for _steps in _split:
+        if any('..' in _step or '::' in _step for _step in _steps[_length:]):
+            return None
+    return ('/'.join(_split[0][:_length]),
+            ['/'.join(_steps[_length:]) for _steps in _split])
+
+
+def compile_xpath(xpath):
+    """Compile an XPath spec so it can be repeatedly evaluated.
+
+    If lxml is available the XPath spec is compiled to an lxml XPath object,
+    otherwise (or if lxml cannot compile the XPath spec) an ElementPath object
+    is used. In either case the returned object is a callable that accepts an
+    element and returns a list of matching elements.
+
+    Compiled XPath specs are cached so that the same XPath spec always returns
+    the same object.
+    """
+
+    _compiled = XPATH_CACHE.get(xpath)
+    if _compiled is None:
+        if HAS_LXML:
+            try:
+                _compiled = ET.XPath(xpath)
+            except ET.XPathSyntaxError:
+                # the spec may use ElementTree only syntax, fall through and
+                # let ElementTree handle it
+                pass
+        if _compiled is None:
+            _compiled = ElementPath(xpath)
+        XPATH_CACHE[xpath] = _compiled
+    return _compiled
+
+
+def element_value(element, attrib=None):
+    """Return the text or an attribute of an element.
+
+    Returns the element text if attrib is None otherwise returns the value of
+    the attrib attribute. Returns None if element is None or the element does
+    not have the attribute.
+    """
+
+    if element is None:
+        return None
+    if attrib is None:
+        return element.text
+    return element.get(attrib, None)
+
+
+def group_extractions(extractions):
+    """Group extractions that use the same compiled XPath spec.
+
+    Takes a list of (target, field, compiled XPath spec, attribute) tuples
+    and returns a list of (compiled XPath spec, uses) tuples where uses is a
+    list of the (target, field, attribute) tuples that use the compiled XPath
+    spec. Order is preserved. Grouping allows each compiled XPath spec to be
+    evaluated once only no matter how many values it provides.
+    """
+
+    _groups = collections.OrderedDict()
+    for _target, _field, _compiled, _attrib in extractions:
+        _groups.setdefault(_compiled, []).append((_target, _field, _attrib))
+    return list(_groups.items())
+
+
+def expat_name(name):
+    """Convert an expat namespace qualified name to ElementTree form."""
+
+    return '{' + name if '}' in name else name
+
+
+def expat_parse(data, target):
+    """Parse XML data using expat and pass the parser events to a target.
+
+    Used in place of the ElementTree XMLParser when lxml is not available.
+    The ElementTree XMLParser passes element text to the target in chunks,
+    typically one chunk per line or entity reference, whereas an expat parser
+    can be set to buffer text so that the text of an element is passed to the
+    target in as few calls as possible. Element and attribute names are
+    passed to the target in the same form as used by ElementTree.
+
+    Parameters:
+        data:   bytes containing the XML data to be parsed
+        target: a parser target (eg an XmlCollector) with start(), end(),
+                data() and close() methods
+
+    Returns the result of the target's close() method.
+    """
+
+    def _start(tag, attrib):
+        if attrib and any('}' in _name for _name in attrib):
+            attrib = dict((expat_name(_name), _value)
+                          for _name, _value in attrib.items())
+        target.start(expat_name(tag), attrib)
+
+    def _end(tag):
+        target.end(expat_name(tag))
+
+    if b'xmlns' in data:
+        # namespace qualified names need to be converted to ElementTree form
+        _parser = expat.ParserCreate(namespace_separator='}')
+        _parser.StartElementHandler = _start
+        _parser.EndElementHandler = _end
+    else:
+        # no namespaces so the names can be passed straight to the target
+        _parser = expat.ParserCreate()
+        _parser.StartElementHandler = target.start
+        _parser.EndElementHandler = target.end
+    _parser.buffer_text = True
+    _parser.CharacterDataHandler = target.data
+    _parser.Parse(data, True)
+    return target.close()
+
+
+class ElementPath(object):
+    """Callable wrapper of an XPath spec evaluated using ElementTree.
+
+    Provides the same call interface as an lxml XPath object for those cases
+    where lxml is not available or cannot compile an XPath spec.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, element):
+        return element.findall(self.path)
+
+    def __repr__(self):
+        return self.path
+
+
 def loader(config_dict, engine):
     return XmlParseDriver(**config_dict[DRIVER_NAME])
 
@@ -248,73 +532,150 @@ class XmlParseDriver(weewx.drivers.AbstractDevice):
     DEFAULT_POLL = 10
     DEFAULT_PATH = '/var/tmp/sensors.xml'
     DEFAULT_MODE = 'master'
+    # maximum number of parsed date-time strings to cache
+    TIME_CACHE_SIZE = 16
 
     def __init__(self, **xml_config_dict):
         # where to find the xml file
         self.path = xml_config_dict.get('path', '/var/tmp/sensor.xml')
-        # get an XmlObject to facilitate reading data from the XML file
-        self.xml = XmlObject(self.path)
+        # index of simple XPath specs that can be harvested in a single pass of
+        # the XML file, keyed by element path
+        self.path_index = dict()
+        # Whether any XPath specs need to be evaluated against the XML tree. If
+        # so the XML tree is built by the (C) parser and all XPath specs are
+        # evaluated against the tree, otherwise the XML tree is never built
+        # and all data is harvested as the XML file is parsed.
+        self.need_tree = any(simple_path(_xpath) is None
+                             for _xpath in self.xpath_specs(xml_config_dict))
         # how often to poll the xml file, seconds
         # wrap in try..except so we can trap an invalid or missing
         # poll_interval config option
         try:
             self.poll_interval = float(xml_config_dict.get('poll_interval'))
-        except ValueError, TypeError:
+        except (ValueError, TypeError):
             raise MissingOption("Missing or invalid 'poll_interval' config option")
         # operate in master or slave mode
         self.mode = xml_config_dict.get('timestamp_mode', 'master').lower()
         # date-time format string
         self.date_time_format = xml_config_dict.get('date_time_format')
-        # time zone
-        _time_zone = xml_config_dict.get('time_zone')
+        # a parser that avoids strptime() if the date-time format allows
+        self.fast_time_parser = FAST_TIME_PARSERS.get(self.date_time_format)
+        # cache of parsed date-time strings keyed by (value, zone)
+        self.time_cache = collections.OrderedDict()
+        # time zone, will be None, ('literal', time zone code) or
+        # ('xpath', compiled Xpath spec, attribute), the time zone is only
+        # used in slave mode
+        _time_zone = self.config_time_zone(xml_config_dict)
         if _time_zone is not None:
             # we have a specified time zone, is it an Xpath spec or a timezone
             # code
-            if hasattr(_time_zone, '__iter__'):
+            if isinstance(_time_zone, (list, tuple)):
                 # its a list so treat it as a complex Xpath spec
                 _arg = _time_zone[1] if len(_time_zone) > 1 else None
-                _time_zone = (_time_zone[0], _arg)
+                _time_zone = ('xpath',
+                              self.compile('timezone', _time_zone[0], _arg),
+                              _arg)
             elif _time_zone.upper() in SUPPORTED_TIMEZONES:
                 # its a timezone code
-                _time_zone = _time_zone.upper()
+                _time_zone = ('literal', _time_zone.upper())
             else:
                 # treat it as a simple Xpath spec
-                _time_zone = (_time_zone[0], None)
+                _time_zone = ('xpath',
+                              self.compile('timezone', _time_zone, None),
+                              None)
         self.time_zone = _time_zone
 
-        # get sensor map
-        # start with an empty dict
-        _sensor_map = dict()
+        # get sensor map, the sensor map is held as a list of WeeWX field
+        # names and a parallel list of SensorEntry objects
+        self.fields = []
+        self.sensors = []
         # get some config dicts we need to simply the code
         _map_dict = xml_config_dict.get('sensor_map', dict())
         _obs_dict = _map_dict.get('obs', dict())
         _units_dict = _map_dict.get('units', dict())
         # iterate over all of the sensor map obs entries
-        for _field, _m in _obs_dict.iteritems():
+        for _field, _m in _obs_dict.items():
             # build the XML data to WeeWX field portion of the sensor map
             _mapping = weeutil.weeutil.option_as_list(_m)
             _arg = _mapping[1] if len(_mapping) > 1 else None
-            # construct the map
-            _sensor_map[_field] = dict()
-            _sensor_map[_field]['obs'] = dict()
-            # the Xpath spec to be used
-            _sensor_map[_field]['obs']['xpath'] = _mapping[0]
-            #
-            _sensor_map[_field]['obs']['arg'] = _arg
+            # construct the map, the compiled Xpath spec saves re-parsing the
+            # spec each poll and will be None if the spec has been indexed
+            _sensor = SensorEntry(_mapping[0],
+                                  _arg,
+                                  self.compile(_field, _mapping[0], _arg))
             # units map
             _um = _units_dict.get(_field)
             if _um is not None:
-                if hasattr(_um, '__iter__'):
-                    # assume we have an Xpath spec
-                    _mapping = weeutil.weeutil.option_as_list(_um)
-                    _arg = _mapping[1] if len(_mapping) > 1 else None
-                    _sensor_map[_field]['units'] = (_mapping[0], _arg)
+                if isinstance(_um, (list, tuple)):
+                    # assume we have an Xpath spec, the conversion function
+                    # will be determined from the XML data each poll
+                    _sensor.units_kind = 'xpath'
+                    _sensor.units_arg = _um[1] if len(_um) > 1 else None
+                    _sensor.units_field = '_'.join((_field, 'units'))
+                    _sensor.units_compiled = self.compile(_sensor.units_field,
+                                                          _um[0],
+                                                          _sensor.units_arg)
                 elif _um in weewx.units.conversionDict:
-                    # we have a WeeWX unit code
-                    _sensor_map[_field]['units'] = _um
+                    # we have a WeeWX unit code, the conversion function is
+                    # always the same
+                    _sensor.units_kind = 'code'
+                    _sensor.units_arg = _um
+                    _sensor.conv_func = CONV_FUNCS.get(_um)
                 else:
-                    print "ignoring invalid unit specification"
-        self.sensor_map = _sensor_map
+                    print("ignoring invalid unit specification")
+            self.fields.append(_field)
+            self.sensors.append(_sensor)
+        # Build flat lists of the data to be obtained each poll. Data for
+        # indexed XPath specs is copied from the harvested data, the harvest
+        # list entries are (target, field, index key). Data for other XPath
+        # specs is extracted from the XML tree, the extractions list entries
+        # are (target, field, compiled XPath spec, attribute). In each case
+        # target is 0 for sensor values or 1 for sensor units.
+        _specs = []
+        for _field, _sensor in zip(self.fields, self.sensors):
+            _specs.append((0, _field, _field, _sensor.compiled, _sensor.arg))
+            if _sensor.units_kind == 'xpath':
+                _specs.append((1, _field, _sensor.units_field,
+                               _sensor.units_compiled, _sensor.units_arg))
+        # the time zone is only ever set in slave mode
+        if self.time_zone is not None and self.time_zone[0] == 'xpath':
+            _specs.append((0, 'timezone', 'timezone',
+                           self.time_zone[1], self.time_zone[2]))
+        self.harvest = []
+        self.extractions = []
+        for _target, _field, _key, _compiled, _attrib in _specs:
+            if _compiled is None:
+                self.harvest.append((_target, _field, _key))
+            else:
+                self.extractions.append((_target, _field, _compiled, _attrib))
+        # If the XPath specs to be evaluated against the XML tree share a
+        # common prefix the element identified by the prefix can be found
+        # once each time the XML file is parsed and the remainder of each
+        # XPath spec evaluated against that element. Keep a parallel list of
+        # extractions using the relative XPath specs.
+        _prefix = common_xpath_prefix([_e[2].path for _e in self.extractions])
+        if _prefix is not None:
+            self.base_path = compile_xpath(_prefix[0])
+            self.rel_extractions = []
+            for _e, _suffix in zip(self.extractions, _prefix[1]):
+                self.rel_extractions.append((_e[0], _e[1],
+                                             compile_xpath(_suffix), _e[3]))
+        else:
+            self.base_path = None
+            self.rel_extractions = self.extractions
+        # compiled XPath specs are shared by identical XPath specs (eg a
+        # sensor value and its units obtained from attributes of the same
+        # element) so group the extractions by compiled XPath spec
+        self.extractions = group_extractions(self.extractions)
+        self.rel_extractions = group_extractions(self.rel_extractions)
+        # cache of conversion functions keyed by unit string
+        self.conv_cache = dict()
+        # get an XmlObject to facilitate reading data from the XML file, we
+        # only need to keep the XML tree if we have compiled XPath specs
+        self.xml = XmlObject(self.path,
+                             path_index=self.path_index,
+                             keep_tree=self.need_tree,
+                             base_path=self.base_path)
 
         # is the rain field cumulative or a delta
         self.rain_delta = weeutil.weeutil.to_bool(xml_config_dict.get('rain_delta',
@@ -331,7 +692,7 @@ class XmlParseDriver(weewx.drivers.AbstractDevice):
             # timestamps are derived from the XML data
             loginf("timestamps will be derived from the XML source")
             loginf("time_zone is %s" % (self.time_zone, ))
-        loginf('sensor map is %s' % self.sensor_map)
+        loginf('sensor map is %s' % dict(zip(self.fields, self.sensors)))
 
     def genLoopPackets(self):
         """Generate loop packets continuously."""
@@ -340,147 +701,257 @@ class XmlParseDriver(weewx.drivers.AbstractDevice):
         # than that of the previous packet, so initialise with a timestamp
         # from the past
         _last_dateTime = int(time.time() - 1)
+        # the packet data from the last time the XML file was read
+        _packet_data = None
+        # when the next poll is due
+        _next_poll = monotonic()
         while True:
             # read xml from the source file
-            self.xml.read_file()
+            self.xml.refresh()
             # get the timestamp we might use
             _ts = int(time.time())
-            # read whatever values we can get from the file
-            _raw_data = self.get_xml()
-            # log raw data if debug >= 2
-            logdbg2("raw data: %s" % weeutil.weeutil.to_sorted_string(_raw_data))
-            # parse the raw data
-            _parsed_data = self.parse_raw_data(_raw_data)
-            # log raw data if debug >= 3
-            logdbg3("parsed data: %s" % weeutil.weeutil.to_sorted_string(_parsed_data))
+            if self.xml.unchanged and _packet_data is not None:
+                # the XML file has not changed since it was last read so we
+                # can reuse the packet data from last time
+                logdbg3("XML file unchanged, reusing packet data")
+            else:
+                # read whatever values we can get from the file
+                _raw_data, _raw_units = self.get_xml()
+                # log raw data if debug >= 2, check the debug level first to
+                # avoid formatting log messages that will not be logged
+                if weewx.debug >= 2:
+                    logdbg2("raw data: %s" % weeutil.weeutil.to_sorted_string(_raw_data))
+                    logdbg2("raw units: %s" % weeutil.weeutil.to_sorted_string(_raw_units))
+                # parse and convert the raw data
+                _packet_data = self.build_packet(_raw_data, _raw_units)
+                # log packet data if debug >= 3
+                if weewx.debug >= 3:
+                    logdbg3("packet data: %s" % weeutil.weeutil.to_sorted_string(_packet_data))
             # if operating in timestamp master mode set the dateTime field to a
             # system generated timestamp
             if self.mode == 'master':
-                _parsed_data['dateTime'] = _ts
+                _packet_data['dateTime'] = _ts
             # we will only yield a packet if this packets dateTime is greater than
-            # that of the last so we can discard this data if this is not the case
-            if _parsed_data['dateTime'] > _last_dateTime:
-                # convert the parsed data
-                _converted_data = self.convert_data(_parsed_data)
-                # log converted data if debug >= 3
-                logdbg3("converted data: %s" % weeutil.weeutil.to_sorted_string(_converted_data))
-                # we are going to pop off any xxxx_units fields so take a copy of
-                # our converted data dict
-                _packet_data = dict(_converted_data)
-                # now pop off any xxxx_units fields
-                for _keys in _converted_data:
-                    if _keys.endswith('_units'):
-                        _ = _packet_data.pop(_keys)
-                # convert rain to a delta if required
-                if 'rain' in _packet_data and not self.rain_delta:
-                    _old_rain = _packet_data['rain']
-                    _packet_data['rain'] = weewx.wxformulas.calculate_rain(_packet_data['rain'],
-                                                                           self.old_rain)
-                    self.old_rain = _old_rain
+            # that of the last so we can discard this data if this is not the
+            # case, a dateTime of None (eg date-time could not be parsed) is
+            # likewise discarded
+            _dt = _packet_data.get('dateTime')
+            if _dt is not None and _dt > _last_dateTime:
                 # map the data into a weewx loop packet
                 _packet = {'usUnits': weewx.METRICWX}
                 _packet.update(_packet_data)
+                # convert rain to a delta if required
+                if 'rain' in _packet and not self.rain_delta:
+                    _old_rain = _packet['rain']
+                    _packet['rain'] = weewx.wxformulas.calculate_rain(_packet['rain'],
+                                                                      self.old_rain)
+                    self.old_rain = _old_rain
                 # yield the packet
                 yield _packet
                 # log packet if debug >= 2
-                logdbg2("packet: %s" % weeutil.weeutil.to_sorted_string(_packet))
+                if weewx.debug >= 2:
+                    logdbg2("packet: %s" % weeutil.weeutil.to_sorted_string(_packet))
                 # record the time of this packet as the time of the last packet
                 _last_dateTime = _packet['dateTime']
-            # sleep until its time to do it all again
-            time.sleep(self.poll_interval)
+            # sleep until its time to do it all again, polls are scheduled at
+            # fixed intervals so the time taken to process each poll does not
+            # add to the interval between polls
+            _next_poll += self.poll_interval
+            _delay = _next_poll - monotonic()
+            if _delay > 0:
+                time.sleep(_delay)
+            else:
+                # we have overrun so reset our schedule
+                _next_poll = monotonic()
 
     @property
     def hardware_name(self):
         """Property to return the 'hardware' name."""
         return "XmlParse"
 
+    @staticmethod
+    def config_time_zone(xml_config_dict):
+        """Return the time zone config option of a driver config stanza.
+
+        The time zone is only used when operating in slave mode. Returns None
+        if operating in master mode or if the time zone config option is
+        omitted or empty.
+        """
+
+        if xml_config_dict.get('timestamp_mode', 'master').lower() != 'slave':
+            return None
+        _time_zone = xml_config_dict.get('time_zone')
+        if isinstance(_time_zone, (list, tuple)):
+            if not _time_zone or not _time_zone[0]:
+                return None
+        elif not _time_zone:
+            return None
+        return _time_zone
+
+    @staticmethod
+    def xpath_specs(xml_config_dict):
+        """Generate the XPath specs used by a driver config stanza."""
+
+        _time_zone = XmlParseDriver.config_time_zone(xml_config_dict)
+        if isinstance(_time_zone, (list, tuple)):
+            yield _time_zone[0]
+        elif _time_zone is not None and _time_zone.upper() not in SUPPORTED_TIMEZONES:
+            yield _time_zone
+        _map_dict = xml_config_dict.get('sensor_map', dict())
+        for _m in _map_dict.get('obs', dict()).values():
+            yield weeutil.weeutil.option_as_list(_m)[0]
+        for _um in _map_dict.get('units', dict()).values():
+            if isinstance(_um, (list, tuple)):
+                yield _um[0]
+
+    def compile(self, key, xpath, attrib):
+        """Prepare an XPath spec for use when polling the XML file.
+
+        If the XML tree is not needed simple XPath specs are added to the path
+        index so that the corresponding data can be harvested while the XML
+        file is read. Otherwise XPath specs are compiled for evaluation
+        against the XML tree.
+
+        Inputs:
+            key:    the key under which the data obtained is to be stored
+            xpath:  string containing the XPath spec
+            attrib: string containing the name of the element attribute to be
+                    used, may be None
+
+        Returns:
+            None if the XPath spec was indexed otherwise the compiled XPath
+            spec.
+        """
+
+        if not self.need_tree:
+            _path = simple_path(xpath)
+            if _path is not None:
+                self.path_index.setdefault(_path, []).append((key, attrib))
+                return None
+        return compile_xpath(xpath)
+
     def get_xml(self):
-        """Get a dict of raw data from the XML source file.
+        """Get dicts of raw data and units from the XML source file.
 
-        Iterates over the sensor map looking for sensor values and units in the
-        XML tree. If found the sensor value is added to a dict. Time zone is
-        only considerd if operating in timezone slave mode.
+        Obtains sensor values and units from the data harvested when the XML
+        file was read or, for XPath specs that were not indexed, from the XML
+        tree using the harvest and extractions lists. Sensor values are added
+        to one dict and sensor units to another, both are keyed by WeeWX field
+        name. Time zone is only considerd if operating in timezone slave mode
+        and is added to the sensor values dict.
 
         Returns:
-            Dict containing sensor values and units.
+            Tuple consisting of a dict containing sensor values and a dict
+            containing sensor units.
         """
 
-        _data = dict()
-        # get sensor mapped data
-        for _sensor, _map in self.sensor_map.iteritems():
-            _data[_sensor] = self.xml.get_xpath(_map['obs']['xpath'],
-                                                _map['obs']['arg'])
+        # sensor values and sensor units dicts
+        _raw = (dict(), dict())
+        # copy data harvested using the path index
+        _harvested = self.xml.values
+        for _target, _field, _key in self.harvest:
+            _raw[_target][_field] = _harvested.get(_key)
+        # extract data for XPath specs that were not indexed, if we have a
+        # base element use the XPath specs relative to the base element
+        _base = self.xml.base
+        if _base is not None:
+            _element = _base
+            _extractions = self.rel_extractions
+        else:
+            _element = self.xml.root if self.extractions else None
+            _extractions = self.extractions
+        # each compiled XPath spec is evaluated once only
+        for _compiled, _uses in _extractions:
+            _elements = _compiled(_element)
+            _first = _elements[0] if _elements else None
+            for _target, _field, _attrib in _uses:
+                _raw[_target][_field] = element_value(_first, _attrib)
+        _data, _units = _raw
         # get timezone data
         if self.mode == 'slave':
-            if hasattr(self.time_zone, '__iter__'):
-                # wrap in try..except to catch the case where the xpath spec
-                # returns None or is invalid
-                try:
-                    _data['timezone'] = self.xml.get_xpath(self.time_zone[0],
-                                                           self.time_zone[1])
-                except AttributeError:
-                    _data['timezone'] = None
-                    logdbg("Time zone could not be found in XML data")
-            else:
-                _data['timezone'] = self.time_zone
-        # get unit data
-        for _sensor, _map in self.sensor_map.iteritems():
-            if 'units' in _map and hasattr(_map['units'], '__iter__'):
-                # we have a units map and its a list/tuple (so its a Xpath spec)
-                _field = '_'.join((_sensor, 'units'))
-                _data[_field] = self.xml.get_xpath(_map['units'][0],
-                                                   _map['units'][1])
-        return _data
-
-    def parse_raw_data(self, raw_data):
-        """Parse a dict of raw data.
-
-        Takes a data dict of raw data in string format and parses fields
-        appropriately. The following parsing is applied:
+            if self.time_zone is None:
+                _data['timezone'] = None
+            elif self.time_zone[0] == 'literal':
+                _data['timezone'] = self.time_zone[1]
+            elif _data['timezone'] is None:
+                logdbg("Time zone could not be found in XML data")
+        return _data, _units
+
+    def build_packet(self, raw_data, raw_units):
+        """Build loop packet data from dicts of raw data and units.
+
+        Takes a data dict of raw data in string format and parses and converts
+        the data for each field in the sensor map in a single pass. The
+        following parsing is applied:
 
             dateTime:     interpreted as a timestamp if operating in slave
+                          timestamp mode, omitted if operating in master
                           timestamp mode
-            timezone:     unchanged
-            units fields: unchanged
             other fields: converted to float or None if float conversion is not
                           possible
 
+        The xmlparse driver yields METRICWX packets. Parsed XML data may use
+        units that are unknown to WeeWX or may use unit codes that are
+        different to those used by WeeWX. Parsed data is converted to the
+        relevant WeeWX METRICWX units by use of standard conversion functions
+        defined in weewx.units where possible. Additional XML unit codes may be
+        supported by adding appropriate key-value pairs to CONV_FUNCS.
+
+        Parsed data that does not have a corresponding units field entry or for
+        which there is no conversion function lookup entry is left unchanged.
+
+        Conversion functions for fields with a units code in the sensor map
+        are determined when the driver is initialised. Conversion functions
+        for fields with units obtained from the XML data are cached by unit
+        string.
+
         Input:
-            raw_data: dict containing the raw data (including units fields) in
-                      obs:value format
+            raw_data:  dict containing the raw data (including the timezone
+                       field) in obs:value format
+            raw_units: dict containing the raw units in obs:units format
 
         Returns:
-            Dict containing all original fields with data parsed appropriately.
+            Dict containing the parsed and converted data for each field in the
+            sensor map. The timezone field is not included.
         """
 
-        # empty dict for parsed data
-        _data = dict()
-        # iterate over all input data fields
-        for _field, _value in raw_data.iteritems():
-            # interpret dateTime formatted string as a timestamp if we are in
-            # timestamp slave mode
-            if _field == 'dateTime' and self.mode == 'slave':
-                # store the parsed dateTime field in our results dict
-                _data[_field] = self.parse_time(_value, raw_data['timezone'])
-            # pass field timezone and any units fields through unchanged
-            elif _field == 'timezone' or _field.endswith('_units'):
-                # store the field in our results dict
-                _data[_field] = _value
+        # empty dict for our packet data
+        _packet = dict()
+        # iterate over all sensor map entries
+        for _field, _sensor in zip(self.fields, self.sensors):
+            _value = raw_data.get(_field)
+            if _field == 'dateTime':
+                # interpret dateTime formatted string as a timestamp if we are
+                # in timestamp slave mode
+                if self.mode == 'slave':
+                    _packet[_field] = self.parse_time(_value,
+                                                      raw_data.get('timezone'))
+                continue
             # otherwise treat the field as a numeric obs and try to convert to
             # a float
-            else:
+            try:
+                _value = float(_value)
+            except (ValueError, TypeError):
+                # cannot convert to a float so set to None - there is
+                # something there but its not valid
+                _packet[_field] = None
+                continue
+            # work out what function, if any, to use to convert the data
+            if _sensor.units_kind == 'xpath':
+                # the units are in the raw data
+                _units = raw_units.get(_field)
                 try:
-                    _parsed = float(_value)
-                except ValueError:
-                    # cannot convert to a float so set to None - there is
-                    # something there but its not valid
-                    _parsed = None
-                # store the parsed obs in our results dict
-                _data[_field] = _parsed
-        # timezone is no longer needed so pop off the timezone field
-        _ = _data.pop('timezone', None)
-        # return the parsed data dict
-        return _data
+                    _conv_func = self.conv_cache[_units]
+                except KeyError:
+                    _conv_func = CONV_FUNCS.get(_units)
+                    self.conv_cache[_units] = _conv_func
+            else:
+                # if we have a unit code the conversion function is known
+                _conv_func = _sensor.conv_func
+            # if we have a conversion function then apply it
+            _packet[_field] = _conv_func(_value) if _conv_func else _value
+        # return the packet data dict
+        return _packet
 
     def parse_time(self, value, zone):
         """Parse a formatted string and return a Unix epoch timestamp.
@@ -499,111 +970,294 @@ class XmlParseDriver(weewx.drivers.AbstractDevice):
             Epoch timestamp of value and zone.
         """
 
+        # strptime is slow and the same date-time string is often seen on
+        # successive polls so check our cache first
         try:
-            _dt = datetime.datetime.strptime(value,
-                                             self.date_time_format)
-        except ValueError:
+            return self.time_cache[(value, zone)]
+        except KeyError:
+            pass
+        _ts = self._parse_time(value, zone)
+        self.time_cache[(value, zone)] = _ts
+        # limit the size of our cache by discarding the oldest entry
+        if len(self.time_cache) > self.TIME_CACHE_SIZE:
+            self.time_cache.popitem(last=False)
+        return _ts
+
+    def _parse_time(self, value, zone):
+        """Parse a formatted string without using the cache."""
+
+        # there is nothing to parse if the date-time was not found
+        if value is None:
             return None
+        _dt = None
+        # use the fast parser if we have one, fall back to strptime() if the
+        # fast parser cannot handle the date-time string
+        if self.fast_time_parser is not None:
+            try:
+                _dt = self.fast_time_parser(value)
+            except ValueError:
+                pass
+        if _dt is None:
+            try:
+                _dt = datetime.datetime.strptime(value,
+                                                 self.date_time_format)
+            except (ValueError, TypeError):
+                return None
         if zone is None or zone not in SUPPORTED_TIMEZONES:
-            # we have a local time
+            # we have a local time, let mktime() apply the local time zone
+            # rules, the cost is absorbed by the parse_time() cache
             _ts = time.mktime(_dt.timetuple())
         else:
             # we have a time in GMT/UTC
             _ts = calendar.timegm(_dt.timetuple())
         return int(_ts)
 
-    @staticmethod
-    def convert_data(data):
-        """Convert a dict of parsed data.
 
-        The xmlparse driver yields METRICWX packets. Parsed XML data may use
-        units that are unknown to WeeWX or may use unit codes that are
-        different to those used by WeeWX. Parsed data is converted to the
-        relevant WeeWX METRICWX units by use of standard conversion functions
-        defined in weewx.units where possible. Additional XML unit codes may be
-        supported by adding appropriate key-value pairs to CONV_FUNCS.
+class SensorEntry(object):
+    """Class to hold a sensor map entry.
+
+    Holds the Xpath spec, attribute and compiled Xpath spec used to obtain the
+    data for a WeeWX field as well as details of the units used by the data.
+    Attributes are held in slots rather than in a per-instance dict.
+
+    Attributes:
+        xpath:          the Xpath spec for the field data
+        arg:            the attribute used for the field data, may be None
+        compiled:       the compiled Xpath spec for the field data, None if the
+                        Xpath spec was indexed
+        units_kind:     None if no units are specified, 'code' if a WeeWX unit
+                        code is specified or 'xpath' if the units are obtained
+                        from the XML data
+        units_arg:      the WeeWX unit code if units_kind is 'code' or the
+                        attribute used for the units data if units_kind is
+                        'xpath'
+        units_field:    the path index key for the units data if
+                        units_kind is 'xpath'
+        units_compiled: the compiled Xpath spec for the units data, None if
+                        the Xpath spec was indexed or units_kind is not 'xpath'
+        conv_func:      the conversion function to be used if units_kind is
+                        'code', may be None
+    """
 
-        Parsed data that does not have a corresponding units field entry or for
-        which there is no conversion function lookup entry is left unchanged.
+    __slots__ = ('xpath', 'arg', 'compiled', 'units_kind', 'units_arg',
+                 'units_field', 'units_compiled', 'conv_func')
 
-        Input:
-            data: dict containing the parsed data (including units fields) in
-                  obs:value format
+    def __init__(self, xpath, arg, compiled):
+        """Initialise our class."""
 
-        Returns:
-            Dict containing all original data with obs values converted to
-            METRICWX units.
-        """
+        self.xpath = xpath
+        self.arg = arg
+        self.compiled = compiled
+        self.units_kind = None
+        self.units_arg = None
+        self.units_field = None
+        self.units_compiled = None
+        self.conv_func = None
 
-        # empty dict for converted data
-        _converted = dict()
-        # iterate over all input data fields
-        for _field, _value in data.iteritems():
-            # assume the converted value is the starting value
-            _conv_value = _value
-            # we will only convert if we have a non-None value otherwise return
-            # None
-            if _value is not None:
-                # if there was a units field for this field what would it be
-                _units_field = ''.join((_field, '_units'))
-                # do we have a units field
-                if _units_field in data:
-                    # we have a units field for _field so what function do we use
-                    # to convert the data
-                    _conv_func = CONV_FUNCS.get(data[_units_field])
-                    # if we have a conversion function then apply it
-                    if _conv_func:
-                        _conv_value = _conv_func(_value)
-            # add the converted data the results dict
-            _converted[_field] = _conv_value
-        # return the converted data dict
-        return _converted
+    def __repr__(self):
+        _obs = (self.xpath, self.arg)
+        if self.units_kind is None:
+            return "%s" % (_obs, )
+        return "%s units: %s" % (_obs, (self.units_kind, self.units_arg))
 
 
 class XmlObject(object):
     """Class to obtain data from an XML source.
 
     This class allows basic data extraction from an XML structured source file
-    using the python ElementTree XML API. The class only requires a path and
+    using the python ElementTree XML API. If available the lxml implementation
+    of the ElementTree API is used. The class only requires a path and
     file name of a valid XML structured file. The get_xpath() method supports
     the use of an XPath specification to identify and return a data element of
     interest. The root and tostring properties provide a means of obtaining the
     XML root element.
 
+    Data for simple XPath specifications (refer simple_path()) may be harvested
+    by supplying a path index. If the XML tree is not kept the data is
+    harvested in a single pass as the file is parsed and the XML tree is never
+    built.
+
     Required parameters:
         path: string containing the path and file name of a vild XML format
               text file
 
+    Optional parameters:
+        path_index: dict keyed by element path tuple of lists of (key, attrib)
+                    tuples. The data for each matching element is saved in the
+                    values property under key.
+        keep_tree:  whether to retain the XML tree once the file has been
+                    read. Default is True.
+        base_path:  compiled XPath spec of an element used as the base for
+                    relative XPath specs. Default is None.
+        keep_raw:   whether to retain the contents of the XML file once the
+                    file has been read. Default is False.
+
     Methods:
         read_file: Read an XM file and parse the contents using the ElementTree
                    library.
+        refresh:   As per read_file but the file is only read if its status
+                   indicates it may have changed.
         get_xpath: Extract an XML data value given an XPath specification. If
                    an optional attrib value is given the data extracted is the
                    'attrib' attribute of the element specified is returned.
+        get_compiled: As per get_xpath but uses a compiled XPath specification
+                      as returned by compile_xpath().
 
     Properties:
         root: return the root element of the XML tree
 
         tostring: returns a string representation of the entire XML tree
+
+        raw_bytes: the contents of the XML file as last read, None unless
+                   keep_raw is True
     """
 
-    def __init__(self, path):
+    __slots__ = ('path', 'path_index', 'keep_tree', 'base_path', 'keep_raw',
+                 'tree', 'base', 'values', 'raw_bytes', '_last_hash', '_last_stat',
+                 '_last_read', 'unchanged')
+
+    # worst case file system modification time resolution in seconds
+    MTIME_RESOLUTION = 2
+
+    def __init__(self, path, path_index=None, keep_tree=True, base_path=None,
+                 keep_raw=False):
         """Initialise our class."""
 
         # the path and file name of the xml source file
         self.path = path
-        # initialise the xml tree
+        # the index of element paths whose data is to be harvested
+        self.path_index = path_index if path_index is not None else dict()
+        # whether to keep the xml tree
+        self.keep_tree = keep_tree
+        # compiled XPath spec of our base element
+        self.base_path = base_path
+        # whether to keep the contents of our file
+        self.keep_raw = keep_raw
+        # initialise the xml tree and base element
         self.tree = None
+        self.base = None
+        # initialise the harvested data
+        self.values = dict()
+        # the contents of our file when last read
+        self.raw_bytes = None
+        # hash of our file contents when last parsed
+        self._last_hash = None
+        # signature of our file status and the time it was last read
+        self._last_stat = None
+        self._last_read = None
+        # whether our file was unchanged when last read
+        self.unchanged = False
 
     def read_file(self):
-        """Read xml data from our file."""
+        """Read xml data from our file.
+
+        The file contents are hashed and the file is only parsed if the hash
+        differs from that of the contents last parsed. Hashing the contents
+        rather than checking the file modification time means changes are not
+        missed on file systems with coarse modification time resolution. The
+        unchanged property is set to indicate whether the file was parsed.
+        """
 
-        # get the parsed xml tree, log an error if it cannot be parsed
+        # parse the xml file, log an error if it cannot be parsed
         try:
-            self.tree = ET.parse(self.path)
+            _read_time = time.time()
+            # the whole file is read in one go so there is no benefit in
+            # buffering, read it unbuffered to avoid an extra copy
+            with open(self.path, 'rb', 0) as f:
+                _stat = os.fstat(f.fileno())
+                _data = f.read()
+            if self.keep_raw:
+                self.raw_bytes = _data
+            _hash = content_hash(_data)
+            if _hash == self._last_hash:
+                self.unchanged = True
+            else:
+                self.unchanged = False
+                self.parse(_data)
+                self._last_hash = _hash
+            self._last_stat = stat_signature(_stat)
+            self._last_read = _read_time
         except Exception as e:
             logerr("XML parse failed: %s" % e)
 
+    def refresh(self):
+        """Read xml data from our file if the file may have changed.
+
+        If the file status (modification time, size and inode) is the same as
+        when the file was last read, and the file had last been modified well
+        before it was last read, then the file has not changed and is not
+        read. Otherwise the file is read using read_file(). The unchanged
+        property is set to indicate whether the file was parsed.
+
+        The file must have last been modified at least MTIME_RESOLUTION
+        seconds before it was last read as a file modified within the file
+        system modification time resolution of our last read could have
+        changed without its modification time changing.
+        """
+
+        if self._last_stat is not None:
+            try:
+                _stat = os.stat(self.path)
+            except OSError:
+                # let read_file() deal with (and log) the problem
+                pass
+            else:
+                if (stat_signature(_stat) == self._last_stat and
+                        _stat.st_mtime < self._last_read - self.MTIME_RESOLUTION):
+                    self.unchanged = True
+                    return
+        self.read_file()
+
+    def parse(self, data):
+        """Parse XML data harvesting any indexed data.
+
+        If the XML tree is being kept the XML data is parsed entirely in C and
+        any indexed data is then obtained from the XML tree. Otherwise the
+        XML data is fed to a parser whose target is an XmlCollector object.
+        The XmlCollector saves the data for any elements in the path index as
+        the data is parsed and no XML tree is built. The XmlCollector costs
+        more CPU time than a plain parse, as every parser event is passed to
+        python, but saves the memory used by the XML tree.
+
+        Parameters:
+            data: bytes containing the XML data to be parsed
+        """
+
+        if self.keep_tree:
+            _root = ET.fromstring(data)
+            self.tree = ET.ElementTree(_root)
+            _values = dict()
+            for _path, _entries in self.path_index.items():
+                _element = _root.find('/'.join(_path))
+                for _key, _attrib in _entries:
+                    _values[_key] = element_value(_element, _attrib)
+            self.values = _values
+        else:
+            _collector = XmlCollector(self.path_index)
+            if HAS_LXML:
+                _parser = ET.XMLParser(target=_collector)
+                _parser.feed(data)
+                _parser.close()
+            else:
+                expat_parse(data, _collector)
+            self.values = _collector.values
+            self.tree = None
+        self.set_base()
+
+    def set_base(self):
+        """Find the base element identified by our base path.
+
+        The base element is only used if the base path identifies exactly one
+        element, otherwise XPath specs relative to the base element could give
+        a different result to the full XPath specs.
+        """
+
+        self.base = None
+        if self.base_path is not None and self.tree is not None:
+            _elements = self.base_path(self.root)
+            if len(_elements) == 1:
+                self.base = _elements[0]
+
     def get_xpath(self, xpath, attrib=None):
         """Return a value from an XML tree given an get XPath spec.
 
@@ -640,6 +1294,26 @@ class XmlObject(object):
         else:
             return self.tree.find(xpath).get(attrib, None)
 
+    def get_compiled(self, compiled, attrib=None, element=None):
+        """Return a value from an XML tree given a compiled XPath spec.
+
+        Operates as per get_xpath() except the XPath spec is a compiled XPath
+        spec as returned by compile_xpath(). As the XPath spec has already been
+        compiled the cost of parsing the XPath spec on each call is avoided.
+
+        Parameters:
+            compiled: compiled XPath spec
+            attrib:   string containing the name of the element attribute to
+                      be returned
+            element:  the element the XPath spec is relative to, if omitted
+                      the root element is used
+        """
+
+        if element is None:
+            element = self.root
+        _elements = compiled(element)
+        return element_value(_elements[0] if _elements else None, attrib)
+
     @property
     def root(self):
         """Return the root element for the XML tree."""
@@ -653,6 +1327,79 @@ class XmlObject(object):
         return ET.tostring(self.root)
 
 
+class XmlCollector(object):
+    """Parser target that harvests data from the elements in a path index.
+
+    An XmlCollector is used as the target of an XML parser. The element path
+    of each element is tracked as the XML data is parsed. If the element path
+    is in the path index the element text or attribute for each matching
+    index entry is saved in the values property. Only the first element
+    matching an element path is used. Element paths are relative to the root
+    element. Text is only accumulated for elements in the path index. No XML
+    tree is built.
+
+    Required parameters:
+        path_index: dict keyed by element path tuple of lists of (key, attrib)
+                    tuples
+    """
+
+    def __init__(self, path_index):
+        """Initialise our class."""
+
+        self.path_index = path_index
+        # the harvested data
+        self.values = dict()
+        # the path of the current element as a list of element names
+        self._path = []
+        # text chunks of the current element, None if text is not wanted
+        self._text = None
+
+    def start(self, tag, attrib):
+        # any text of the parent element has now been seen
+        if self._text is not None:
+            self._finish_text()
+        self._path.append(tag)
+        # element paths are relative to the root element so omit the root
+        # element name from our lookup
+        _entries = self.path_index.get(tuple(self._path[1:]))
+        if _entries is not None:
+            _wanted = []
+            for _key, _attrib in _entries:
+                if _key in self.values:
+                    continue
+                if _attrib is None:
+                    _wanted.append(_key)
+                else:
+                    self.values[_key] = attrib.get(_attrib, None)
+            if _wanted:
+                # we need the text of this element
+                self._text = (_wanted, [])
+
+    def data(self, data):
+        if self._text is not None:
+            self._text[1].append(data)
+
+    def end(self, tag):
+        if self._text is not None:
+            self._finish_text()
+        self._path.pop()
+
+    def close(self):
+        # any indexed data that was not found is None
+        for _entries in self.path_index.values():
+            for _key, _attrib in _entries:
+                self.values.setdefault(_key, None)
+
+    def _finish_text(self):
+        """Save the text accumulated for the current element."""
+
+        _keys, _chunks = self._text
+        _value = ''.join(_chunks) if _chunks else None
+        for _key in _keys:
+            self.values.setdefault(_key, _value)
+        self._text = None
+
+
 class XmlParseConfEditor(weewx.drivers.AbstractConfEditor):
 
     @property
@@ -757,22 +1504,22 @@ class XmlParseConfEditor(weewx.drivers.AbstractConfEditor):
 
     def prompt_for_settings(self):
         settings = dict()
-        print "Specify the polling interval to be used in seconds"
+        print("Specify the polling interval to be used in seconds")
         settings['poll_interval'] = self._prompt('poll_interval',
                                                  dflt=XmlParseDriver.DEFAULT_POLL)
-        print "Specify the path and file name of the XML source file"
+        print("Specify the path and file name of the XML source file")
         settings['path'] = self._prompt('path',
                                         dflt=XmlParseDriver.DEFAULT_PATH)
-        print "Specify timestamp mode, 'master' to derive timestamps from"
-        print "WeeWX system clock or 'slave' to derive timestamps from the"
-        print "XML source file"
+        print("Specify timestamp mode, 'master' to derive timestamps from")
+        print("WeeWX system clock or 'slave' to derive timestamps from the")
+        print("XML source file")
         settings['timestamp_mode'] = self._prompt('timestamp_mode',
                                                   dflt=XmlParseDriver.DEFAULT_MODE)
         return settings
 
     def modify_config(self, config_dict):
-        print """
-Setting record_generation to software."""
+        print("""
+Setting record_generation to software.""")
         config_dict['StdArchive']['record_generation'] = 'software'
 
 
@@ -788,96 +1535,125 @@ Setting record_generation to software."""
 #   The above commands will display details of available command line options.
 
 if __name__ == "__main__":
-    usage = """%prog [options] [--help]"""
+    usage = """%(prog)s [options] [--help]"""
 
     def main():
-        import optparse
+        import argparse
 
         syslog.openlog('xmlparse', syslog.LOG_PID | syslog.LOG_CONS)
-        parser = optparse.OptionParser(usage=usage)
-        parser.add_option('--version', dest='version', action='store_true',
-                          help='display driver version number')
-        parser.add_option('--config', dest='config_path', metavar='CONFIG_FILE',
-                          help="use configuration file CONFIG_FILE.")
-        parser.add_option('--run-driver', dest='run_driver',
-                          action='store_true',
-                          metavar='RUN_DRIVER', help='run the xmlparse driver')
+        parser = argparse.ArgumentParser(usage=usage)
+        parser.add_argument('--version', dest='version', action='store_true',
+                            help='display driver version number')
+        parser.add_argument('--config', dest='config_path', metavar='CONFIG_FILE',
+                            help="use configuration file CONFIG_FILE.")
+        parser.add_argument('--run-driver', dest='run_driver',
+                            action='store_true',
+                            help='run the xmlparse driver')
         # yet to be implemented
-        # parser.add_option('--run-service', dest='run_service', action='store_true',
-        #                    metavar='RUN_SERVICE', help='run the Bloomsky service')
-        parser.add_option('--path', dest='xml_path', metavar='XML_PATH',
-                          help='path and file name of xml file')
-        parser.add_option('--display-xml', dest='display_xml',
-                          action='store_true',
-                          help='display the parsed xml file contents')
-        parser.add_option('--pretty-print-xml', dest='pprint_xml',
-                          action='store_true',
-                          help='pretty print the parsed xml file contents')
-        (opts, args) = parser.parse_args()
+        # parser.add_argument('--run-service', dest='run_service', action='store_true',
+        #                     help='run the Bloomsky service')
+        parser.add_argument('--path', dest='xml_path', metavar='XML_PATH',
+                            help='path and file name of xml file')
+        parser.add_argument('--display-xml', dest='display_xml',
+                            action='store_true',
+                            help='display the xml file contents')
+        parser.add_argument('--pretty-print-xml', dest='pprint_xml',
+                            action='store_true',
+                            help='pretty print the parsed xml file contents')
+        # any positional arguments are passed to weecfg when locating the
+        # config file, positional arguments may appear either side of options
+        # so collect any left over from parsing but reject unknown options
+        parser.add_argument('args', nargs='*', help=argparse.SUPPRESS)
+        opts, _extras = parser.parse_known_args()
+        _unknown = [_arg for _arg in _extras if _arg.startswith('-')]
+        if _unknown:
+            parser.error("unrecognized arguments: %s" % ' '.join(_unknown))
+        args = opts.args + _extras
 
         # display driver version number
         if opts.version:
-            print "%s driver version: %s" % (DRIVER_NAME, DRIVER_VERSION)
+            print("%s driver version: %s" % (DRIVER_NAME, DRIVER_VERSION))
             exit(0)
 
+        # weecfg is only needed to read the config file so import it here
+        # rather than every time the driver is loaded
+        import weecfg
+
         # get config_dict to use
         config_path, config_dict = weecfg.read_config(opts.config_path, args)
         # inform the user of the config file being used
-        print "Using configuration file %s" % config_path
+        print("Using configuration file %s" % config_path)
         # extract the XML driver stanza as a config dict
         xml_config_dict = config_dict.get(DRIVER_NAME, {})
 
-        # run the driver
-        if opts.run_driver:
-            run_driver(xml_config_dict)
-
-        # pretty print the xml data
-        if opts.pprint_xml:
-            # get the path and file name to use as our source, it can be
-            # specified by a command line parameter or obtained from a WeeWX
-            # config file
-            _xml_path = opts.xml_path if opts.xml_path else xml_config_dict.get('path')
-            # pretty print the XML data
-            pprint_xml_data(_xml_path)
-            exit(0)
-
-        # display the xml data
-        if opts.display_xml:
-            # get the path and file name to use as our source, it can be
-            # specified by a command line parameter or obtained from a WeeWX
-            # config file
-            _xml_path = opts.xml_path if opts.xml_path else xml_config_dict.get('path')
-            # display the XML data
-            display_xml_data(_xml_path)
-            exit(0)
+        # get the path and file name to use as our XML source, it can be
+        # specified by a command line parameter or obtained from a WeeWX
+        # config file
+        _xml_path = opts.xml_path if opts.xml_path else xml_config_dict.get('path')
+
+        # the actions we can take in order of precedence, only the first
+        # action requested is taken
+        _actions = [('run_driver', lambda: run_driver(xml_config_dict)),
+                    ('pprint_xml', lambda: pprint_xml_data(read_xml(_xml_path))),
+                    ('display_xml', lambda: display_xml_data(read_xml(_xml_path)))]
+        for _option, _action in _actions:
+            if getattr(opts, _option):
+                _action()
+                exit(0)
 
         # if we reached here then display our usage info
         parser.print_help()
 
-    def display_xml_data(xml_path):
-        """Display the raw parsed xml data."""
-
-        # get an XmlObject
-        xml = XmlObject(xml_path)
-        # now display the data
-        # first a blank line for aesthetics
-        print
-        # now the data
-        print xml.tostring
+    def read_xml(xml_path):
+        """Obtain an XmlObject and read the XML file.
 
-    def pprint_xml_data(xml_path):
-        """Pretty print the raw parsed xml data."""
+        If the XML file cannot be read or parsed an error message is displayed
+        and we exit.
+        """
 
-        from xml.dom import minidom
+        xml = XmlObject(xml_path, keep_raw=True)
+        xml.read_file()
+        if xml.raw_bytes is None:
+            print("Unable to read XML file '%s'" % xml_path)
+            exit(1)
+        if xml.tree is None:
+            print("Unable to parse XML file '%s'" % xml_path)
+            exit(1)
+        return xml
+
+    def display_xml_data(xml):
+        """Display the raw xml data read by an XmlObject."""
+
+        # the raw file contents are displayed as is so there is no need to
+        # serialise the XML tree, first a blank line for aesthetics then the
+        # data
+        _data = xml.raw_bytes
+        if not _data.endswith(b'\n'):
+            _data += b'\n'
+        # write the bytes direct to the underlying binary stream if there is
+        # one (python 3), any text already written must be flushed first
+        sys.stdout.flush()
+        _out = getattr(sys.stdout, 'buffer', sys.stdout)
+        _out.write(b''.join([b'\n', _data]))
+        _out.flush()
+
+    def pprint_xml_data(xml):
+        """Pretty print the raw parsed xml data held by an XmlObject."""
+
+        # format the data, lxml (v4.5 or later) and python 3.9 or later can
+        # indent the already parsed tree so use that if we can otherwise
+        # re-parse the XML data with minidom
+        if hasattr(ET, 'indent'):
+            ET.indent(xml.tree, space="   ")
+            _text = ET.tostring(xml.root, encoding='unicode')
+        else:
+            from xml.dom import minidom
 
-        # get an XmlObject
-        xml = XmlObject(xml_path)
-        # now display the data
-        # first a blank line for aesthetics
-        print
-        # now the data
-        print minidom.parseString(xml.tostring).toprettyxml(indent="   ",
-                                                            newl='')
+            _text = minidom.parseString(xml.raw_bytes).toprettyxml(indent="   ",
+                                                                   newl='')
+        # now display the data in a single write, first a blank line for
+        # aesthetics then the data
+        sys.stdout.write(''.join(['\n', _text, '\n']))
 
     def run_driver(xml_config_dict):
         """Run the xmlparse driver.
@@ -889,9 +1665,15 @@ if __name__ == "__main__":
 
         # obtain and XmlParseDriver object
         driver = XmlParseDriver(**xml_config_dict)
-        # generate and display loop packets indefinitely
+        # generate and display loop packets indefinitely, each packet is
+        # displayed with a single write
+        _write = sys.stdout.write
+        _ts_to_string = weeutil.weeutil.timestamp_to_string
+        _to_sorted_string = weeutil.weeutil.to_sorted_string
         for packet in driver.genLoopPackets():
-            print (weeutil.weeutil.timestamp_to_string(packet['dateTime']),
-                   weeutil.weeutil.to_sorted_string(packet))
+            _write(''.join([_ts_to_string(packet['dateTime']),
+                            ' ',
+                            _to_sorted_string(packet),
+                            '\n']))
 
     main()
@@ -18,22 +18,37 @@
 #       - initial implementation
 #
 
+import re
+
 import weewx
 
-from distutils.version import StrictVersion
 from setup import ExtensionInstaller
 
 REQUIRED_VERSION = "3.0.0"
 XMLPARSE_VERSION = "0.1.0"
 
 
+def version_tuple(version):
+    """Convert a version string to a tuple of ints for comparison.
+
+    Only the leading number of each of the first three components is used so
+    pre-release versions such as '4.0.0b1' compare as their release version.
+    """
+
+    _parts = []
+    for _part in version.split('.')[:3]:
+        _match = re.match(r'\d+', _part)
+        _parts.append(int(_match.group()) if _match else 0)
+    return tuple(_parts)
+
+
 def loader():
     return XmlParseDriverInstaller()
 
 
 class XmlParseDriverInstaller(ExtensionInstaller):
     def __init__(self):
-        if StrictVersion(weewx.__version__) < StrictVersion(REQUIRED_VERSION):
+        if version_tuple(weewx.__version__) < version_tuple(REQUIRED_VERSION):
             _dv = ' '.join(('XML parse', XMLPARSE_VERSION))
             msg = "%s requires WeeWX %s or greater, found %s" % (_dv,
                                                                  REQUIRED_VERSION,